@@ -0,0 +1,16 @@
+import pytest
+
+
+def pytest_configure(config):
+    # Registered by pytest-benchmark when it is installed; declared here too so
+    # the mark is known without the plugin.
+    config.addinivalue_line("markers", "benchmark: performance benchmark (needs pytest-benchmark)")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warmup():
+    """Run the parser once before the first test so one-time costs (first calls,
+    the lazily filled checkbox id table) are not charged to whichever test runs first."""
+    from prompt_template_parser import parse_custom_markdown
+    parse_custom_markdown("")
+    parse_custom_markdown("# x\n[x] y {{{z}}} <<1>> [[a:b]]")
@@ -27,314 +27,262 @@ basename as the input file. If the output file already exists, the script will p
 for confirmation before overwriting.
 """
 
+from __future__ import annotations
+
 import argparse
+import io
 import os
 import re
 import sys
-from typing import Tuple
+from typing import IO, Dict, Iterator, Optional, Tuple
 
-def parse_custom_markdown(md: str) -> Tuple[str, str]:
-    """
-    Parse extended Markdown text and return the full HTML output and language code.
+# Precompiled patterns, shared by every call to parse_custom_markdown().
+_LANG_RE = re.compile(r'#lang:(\w+)#')
+_CLASS_ATTR_RE = re.compile(r'class="([^"]+)"')
 
-    The parser:
-      - Extracts a language code if specified via #lang:xx# (default: en)
-      - Converts custom textarea elements, file load elements, checkboxes,
-        inline comments, inline integer inputs, inline text inputs, and verbatim blocks.
-      - Wraps the generated body in an HTML document with inline CSS and JS.
+_INT_RE = re.compile(r'<<\s*(?P<value>\d+)\s*>>')
+_TEXTAREA_RE = re.compile(r'\[\[\[\s*(?P<placeholder>[^:]+?)\s*:\s*(?P<prefilled>.*?)\s*\]\]\]')
+_INLINE_TB_RE = re.compile(r'\[\[\s*(?P<placeholder>[^:]+?)\s*:\s*(?P<prefilled>.*?)\s*\]\]')
+_FILE_RE = re.compile(r'\(\(\s*\)\)')
+_COMMENT_RE = re.compile(r'\(\*\s*(?P<comment>.*?)\s*\*\)')
 
-    Args:
-        md (str): The input extended Markdown content.
 
-    Returns:
-        Tuple[str, str]: A tuple where the first element is the complete HTML output
-                         and the second is the language code.
-    """
-    # Detect language (default "en")
-    lang_match = re.search(r'#lang:(\w+)#', md)
-    lang: str = lang_match.group(1) if lang_match else 'en'
-    md = re.sub(r'#lang:\w+#', '', md)
+def _replace_number(match: re.Match[str]) -> str:
+    """<<integer_value>> → inline number input (no "prompt-item" so it stays inline)."""
+    return '<input type="number" class="inline-input" value="{}" min="1" />'.format(match.group('value'))
 
-    # Normalize language key for lookup (treat 'jp' and 'ja' the same)
-    lang_key = lang.lower()
-    if lang_key == 'jp':
-        lang_key = 'ja'
-
-    # Button labels per language (HTML-escaped where necessary)
-    BUTTON_LABELS = {
-        'en': "Generate Prompt &amp; Copy to Clipboard",
-        'ja': "プロンプトを生成してクリップボードにコピー",
-        'fr': "Générer le prompt et copier dans le presse-papiers",
-        'it': "Genera prompt e copia negli appunti",
-        'es': "Generar prompt y copiar al portapapeles",
-    }
-    button_label = BUTTON_LABELS.get(lang_key, BUTTON_LABELS['en'])
-
-    title: str = "Document"
-    body_parts: list[str] = []
-
-    # 1. Inline integer input: <<integer_value>>
-    # NOTE: Removed "prompt-item" so it remains inline.
-    md = re.sub(
-        r'<<\s*(?P<value>\d+)\s*>>',
-        lambda m: '<input type="number" class="inline-input" value="{}" min="1" />'.format(m.group('value')),
-        md
-    )
 
-    # 2. Textbox: [[[placeholder:prefilled text]]]
-    def replace_textarea(match: re.Match) -> str:
-        placeholder = match.group('placeholder').strip().strip('"')
-        prefilled = match.group('prefilled').strip()
-        return f'<textarea id="textbox" placeholder="{placeholder}">{prefilled}</textarea>'
-    md = re.sub(
-        r'\[\[\[\s*(?P<placeholder>[^:]+?)\s*:\s*(?P<prefilled>.*?)\s*\]\]\]', 
-        replace_textarea, 
-        md
-    )
+def _replace_textarea(match: re.Match[str]) -> str:
+    """[[[placeholder:prefilled text]]] → textarea."""
+    placeholder = match.group('placeholder').strip().strip('"')
+    prefilled = match.group('prefilled').strip()
+    return f'<textarea id="textbox" placeholder="{placeholder}">{prefilled}</textarea>'
 
-    # 2.1. Inline text box: [[placeholder:prefilled text]]
-    def replace_inline_textbox(match: re.Match) -> str:
-        placeholder = match.group('placeholder').strip().strip('"')
-        prefilled = match.group('prefilled').strip()
-        # Removed the "prompt-item" class to prevent duplicate copying.
-        return f'<input type="text" class="inline-text" placeholder="{placeholder}" value="{prefilled}" />'
-    md = re.sub(
-        r'\[\[\s*(?P<placeholder>[^:]+?)\s*:\s*(?P<prefilled>.*?)\s*\]\]',
-        replace_inline_textbox,
-        md
-    )
 
-    # 3. File load element: (())
-    # Updated to include class "prompt-item" so that file inputs are included in the prompt assembly.
-    md = re.sub(r'\(\(\s*\)\)', '<input type="file" id="fileLoad" class="prompt-item" />', md)
+def _replace_inline_textbox(match: re.Match[str]) -> str:
+    """[[placeholder:prefilled text]] → inline text input."""
+    placeholder = match.group('placeholder').strip().strip('"')
+    prefilled = match.group('prefilled').strip()
+    # Removed the "prompt-item" class to prevent duplicate copying.
+    return f'<input type="text" class="inline-text" placeholder="{placeholder}" value="{prefilled}" />'
 
-    # 4. Inline comment: (* Comment *)
-    def replace_comment(match: re.Match) -> str:
-        comment_text = match.group(1).strip()
-        return f'<span class="comment" data-no-clipboard="true">{comment_text}</span>'
-    md = re.sub(r'\(\*\s*(.*?)\s*\*\)', replace_comment, md)
 
-    # 5. Verbatim blocks: {{{ ... }}}
-    def replace_verbatim(match: re.Match) -> str:
-        content = match.group(1)
-        if "\n" in content:
-            # Block-level verbatim: preserve whitespace and newlines.
-            return f'\n<pre><code>{content}</code></pre>\n'
-        else:
-            # Inline verbatim.
-            return f'<code>{content}</code>'
-    md = re.sub(r'\{\{\{(.*?)\}\}\}', replace_verbatim, md, flags=re.DOTALL)
-
-    # Re-split the text (which now may include inserted HTML) into lines.
-    lines = md.splitlines()
-    i = 0
-    while i < len(lines):
-        # If the current line is part of a block-level verbatim section,
-        # detect and join all lines up to the closing </code></pre>
-        if lines[i].lstrip().startswith("<pre><code>"):
-            verbatim_lines = []
-            while i < len(lines):
-                verbatim_lines.append(lines[i])
-                if lines[i].rstrip().endswith("</code></pre>"):
-                    i += 1
-                    break
-                i += 1
-            body_parts.append("\n".join(verbatim_lines))
-            continue
+def _replace_file(match: re.Match[str]) -> str:
+    """(()) → file load input, marked "prompt-item" so it joins the prompt assembly."""
+    return '<input type="file" id="fileLoad" class="prompt-item" />'
+
+
+def _replace_comment(match: re.Match[str]) -> str:
+    """(* Comment *) → visible span that is excluded from clipboard copying."""
+    comment_text = match.group('comment').strip()
+    return f'<span class="comment" data-no-clipboard="true">{comment_text}</span>'
+
+
+# Inline element passes, run one after another in this order; each pass sees
+# the output of the ones before it, so [[[...]]] is converted before [[...]]
+# can claim its brackets. Entries are (element kind, literal that every match
+# starts with, pattern, handler): a pass is skipped when its literal does not
+# occur, and the kind is recorded in write_html's `features` when it matches.
+_INLINE_PASSES = (
+    ('number', '<<', _INT_RE, _replace_number),
+    ('textarea', '[[[', _TEXTAREA_RE, _replace_textarea),
+    ('inline_text', '[[', _INLINE_TB_RE, _replace_inline_textbox),
+    ('file', '((', _FILE_RE, _replace_file),
+    ('comment', '(*', _COMMENT_RE, _replace_comment),
+)
+
+
+class _WordCharTable(Dict[int, Optional[int]]):
+    """
+    str.translate() table that deletes every character except word characters
+    (letters, digits and "_"). Entries are filled in on first lookup, so it
+    covers all of Unicode without building a table for every code point.
+    """
+
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        value = codepoint if char.isalnum() or char == '_' else None
+        self[codepoint] = value
+        return value
+
+
+_WORD_CHARS = _WordCharTable()
 
-        line = lines[i].strip()
-        # Process header lines (e.g. "# Header")
-        if line.startswith("#"):
-            header_match = re.match(r'^(#{1,6})\s*(.+)$', line)
-            if header_match:
-                header_level = len(header_match.group(1))
-                header_text = header_match.group(2).strip()
-                if title == "Document":
-                    title = header_text
-                body_parts.append(f'<h{header_level}>{header_text}</h{header_level}>')
-            i += 1
-        # Process checkbox lines that start with "[ ]" or "[x]"
-        elif re.match(r'^\[(?:x|X| )\]', line):
-            checkbox_block: list[str] = []
-            while i < len(lines) and re.match(r'^\[(?:x|X| )\]', lines[i].strip()):
-                cb_line = lines[i].strip()
-                cb_match = re.match(r'^\[(?P<status>[xX ]?)\]\s*(?P<label>.+)$', cb_line)
-                if cb_match:
-                    status = cb_match.group('status').lower().strip()
-                    label_text = cb_match.group('label').strip()
-                    checkbox_id = re.sub(r'\s+', '', label_text)
-                    checkbox_id = re.sub(r'\W+', '', checkbox_id)
-                    checked_attr = ' checked' if status == 'x' else ''
-                    checkbox_block.append(
-                        f'<label class="prompt-item"><input type="checkbox" id="{checkbox_id}"{checked_attr} /> {label_text}</label>'
-                    )
-                i += 1
-            if checkbox_block:
-                body_parts.append('<div class="checkbox-container">')
-                body_parts.extend(checkbox_block)
-                body_parts.append('</div>')
-        else:
-            # For textarea elements inserted by our custom syntax, add the "prompt-item" class.
-            if line.startswith("<textarea"):
-                if 'class="' in line:
-                    line = re.sub(r'class="([^"]+)"', r'class="\1 prompt-item"', line)
-                else:
-                    line = line.replace("<textarea", '<textarea class="prompt-item"', 1)
-                body_parts.append(line)
-            else:
-                # For any non-empty line, wrap it in a paragraph tag.
-                if line:
-                    body_parts.append(f'<p class="prompt-item">{line}</p>')
-            i += 1
 
-    html_body = "<div id=\"promptContent\">\n" + "\n".join(body_parts) + "\n</div>"
+def _is_checkbox(line: str) -> bool:
+    """Return True if a stripped line starts with "[ ]", "[x]" or "[X]"."""
+    return len(line) >= 3 and line[0] == '[' and line[2] == ']' and line[1] in ' xX'
 
-    # Build a dynamic <style> block including only the rules for elements that appear in the HTML.
-    style_rules = []
 
-    # Always include basic body styling.
-    style_rules.append("""body {
+def _iter_stripped_lines(text: str) -> Iterator[str]:
+    """
+    Yield the stripped lines of text one at a time, without building a list.
+
+    Splits on "\\n" only, unlike str.splitlines(): other line boundaries such
+    as U+2028, form feed and NEL stay inside the line. "\\r" line endings must
+    already be normalized to "\\n".
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:].strip()
+            return
+        yield text[start:end].strip()
+        start = end + 1
+
+
+# CSS rules for the generated <style> block, in output order. Each rule is
+# paired with the element kind (see write_html) that needs it, or None if it
+# is always included: the body, the generate button and the result box are
+# part of every document.
+_CSS_SPEC = (
+    (None, """body {
       max-width: 800px;
       margin: 0 auto;
       font-family: sans-serif;
-    }""")
-
-    if "<h1>" in html_body:
-       style_rules.append("""h1 {
+    }"""),
+    ('h1', """h1 {
       margin-top: 1em;
       font-size: 2em;
-    }""")
-
-    if "<textarea" in html_body:
-       style_rules.append("""textarea {
+    }"""),
+    ('textarea', """textarea {
       width: 100%;
       height: 100px;
       margin-bottom: 1em;
-    }""")
-
-    if 'class="inline-text"' in html_body:
-       style_rules.append("""input.inline-text {
+    }"""),
+    ('inline_text', """input.inline-text {
       padding: 2px;
       font-size: 1em;
       text-align: center;
-    }""")
-
-    if "<button" in html_body:
-       style_rules.append("""button {
+    }"""),
+    (None, """button {
       padding: 0.5em 1em;
       cursor: pointer;
-    }""")
-
-    style_rules.append(""".result-box {
+    }"""),
+    (None, """.result-box {
       white-space: pre-wrap;
       border: 1px solid #ddd;
       padding: 1em;
       margin-top: 1em;
-    }""")
-
-    if 'class="checkbox-container"' in html_body:
-       style_rules.append(""".checkbox-container {
+    }"""),
+    ('checkbox', """.checkbox-container {
       margin-bottom: 1em;
-    }""")
-
-    if "<label" in html_body:
-       style_rules.append("""label {
+    }"""),
+    ('checkbox', """label {
       display: block;
       margin-bottom: 0.5em;
-    }""")
-
-    if 'class="comment"' in html_body:
-       style_rules.append(""".comment {
+    }"""),
+    ('comment', """.comment {
       color: grey;
-    }""")
-
-    if 'class="inline-input"' in html_body:
-       style_rules.append(""".inline-input {
+    }"""),
+    ('number', """.inline-input {
       width: 3em;
       padding: 2px;
       font-size: 1em;
       text-align: center;
-    }""")
-
-    style_block = "<style>\n" + "\n".join(style_rules) + "\n</style>"
-
-    # Determine which features are present so we only output the necessary JavaScript.
-    has_file_input = '<input type="file"' in html_body
-    has_inline_input = 'class="inline-text"' in html_body
-
-    # Build the script block dynamically.
-    # Note: We no longer include input[type='number'] in the querySelector so that inline number inputs
-    # are processed as part of their parent element.
-    script_parts = []
-    script_parts.append("<script>\n(function(){\n")
-    script_parts.append("  document.getElementById(\"generateButton\").addEventListener(\"click\", async () => {\n")
-    script_parts.append("    const promptItems = [];\n")
-    if has_file_input:
-        script_parts.append("    const elements = document.querySelectorAll(\"#promptContent .prompt-item, pre code, input[type='file']\");\n")
-    else:
-        script_parts.append("    const elements = document.querySelectorAll(\"#promptContent .prompt-item, pre code\");\n")
-    script_parts.append("    for (const el of elements) {\n")
-    script_parts.append("      const tag = el.tagName.toLowerCase();\n")
-    script_parts.append("      if (tag === \"textarea\") {\n")
-    script_parts.append("        promptItems.push(el.value);\n")
-    script_parts.append("      } else if (tag === \"p\") {\n")
-    script_parts.append("        promptItems.push(getElementText(el));\n")
-    script_parts.append("      } else if (tag === \"label\") {\n")
-    script_parts.append("        const checkbox = el.querySelector(\"input[type='checkbox']\");\n")
-    script_parts.append("        if (checkbox && checkbox.checked) {\n")
-    script_parts.append("          promptItems.push(getElementText(el));\n")
-    script_parts.append("        }\n")
-    script_parts.append("      } else if (tag === \"code\") {\n")
-    script_parts.append("        promptItems.push(el.textContent);\n")
-    script_parts.append("      } else if (tag === \"input\" && el.type === \"text\") {\n")
-    script_parts.append("        promptItems.push(el.value);\n")
-    script_parts.append("      }\n")
-    if has_file_input:
-        script_parts.append("      else if (tag === \"input\" && el.type === \"file\") {\n")
-        script_parts.append("        if (el.files && el.files.length > 0) {\n")
-        script_parts.append("          try {\n")
-        script_parts.append("            const fileContent = await readFileAsText(el.files[0]);\n")
-        script_parts.append("            promptItems.push(fileContent);\n")
-        script_parts.append("          } catch (err) {\n")
-        script_parts.append("            console.error(\"Error reading file:\", err);\n")
-        script_parts.append("          }\n")
-        script_parts.append("        }\n")
-        script_parts.append("      }\n")
-    script_parts.append("    }\n")
-    script_parts.append("    const prompt = promptItems.join(\"\\n\");\n")
-    script_parts.append("    navigator.clipboard.writeText(prompt)\n")
-    script_parts.append("      .then(() => { alert(\"Copied to clipboard!\"); })\n")
-    script_parts.append("      .catch((err) => { alert(\"Failed to copy: \" + err); });\n")
-    script_parts.append("    const resultPromptDiv = document.getElementById(\"resultPrompt\");\n")
-    script_parts.append("    resultPromptDiv.hidden = false;\n")
-    script_parts.append("    resultPromptDiv.textContent = prompt;\n")
-    script_parts.append("  });\n")
-    if has_file_input:
-        script_parts.append("\n  function readFileAsText(file) {\n")
-        script_parts.append("    return new Promise((resolve, reject) => {\n")
-        script_parts.append("      const reader = new FileReader();\n")
-        script_parts.append("      reader.onload = () => resolve(reader.result);\n")
-        script_parts.append("      reader.onerror = reject;\n")
-        script_parts.append("      reader.readAsText(file);\n")
-        script_parts.append("    });\n")
-        script_parts.append("  }\n")
-    script_parts.append("\n  function getElementText(el) {\n")
-    script_parts.append("    let text = \"\";\n")
-    script_parts.append("    el.childNodes.forEach(node => {\n")
-    script_parts.append("      if (node.nodeType === Node.ELEMENT_NODE && node.tagName.toLowerCase() === \"input\") {\n")
-    script_parts.append("        if (node.type === \"text\" || node.type === \"number\") {\n")
-    script_parts.append("          text += node.value;\n")
-    script_parts.append("        }\n")
-    script_parts.append("      } else {\n")
-    script_parts.append("        text += node.textContent;\n")
-    script_parts.append("      }\n")
-    script_parts.append("    });\n")
-    script_parts.append("    return text.replace(/\\s+/g, \" \").trim();\n")
-    script_parts.append("  }\n")
-    script_parts.append("})();\n</script>")
-    script_block = "".join(script_parts)
-
-    html_output = f'''<!DOCTYPE html>
+    }"""),
+)
+
+# Static pieces of the generated <script>; the file-input parts are only
+# included when the document contains a (()) element.
+# Note: input[type='number'] is not in the querySelector so that inline number
+# inputs are processed as part of their parent element.
+_JS_HEAD = (
+    "<script>\n(function(){\n"
+    "  document.getElementById(\"generateButton\").addEventListener(\"click\", async () => {\n"
+    "    const promptItems = [];\n"
+)
+_JS_SELECTOR = (
+    "    const elements = document.querySelectorAll(\"#promptContent .prompt-item, pre code\");\n"
+)
+_JS_SELECTOR_WITH_FILE = (
+    "    const elements = document.querySelectorAll(\"#promptContent .prompt-item, pre code, input[type='file']\");\n"
+)
+_JS_LOOP = (
+    "    for (const el of elements) {\n"
+    "      const tag = el.tagName.toLowerCase();\n"
+    "      if (tag === \"textarea\") {\n"
+    "        promptItems.push(el.value);\n"
+    "      } else if (tag === \"p\") {\n"
+    "        promptItems.push(getElementText(el));\n"
+    "      } else if (tag === \"label\") {\n"
+    "        const checkbox = el.querySelector(\"input[type='checkbox']\");\n"
+    "        if (checkbox && checkbox.checked) {\n"
+    "          promptItems.push(getElementText(el));\n"
+    "        }\n"
+    "      } else if (tag === \"code\") {\n"
+    "        promptItems.push(el.textContent);\n"
+    "      } else if (tag === \"input\" && el.type === \"text\") {\n"
+    "        promptItems.push(el.value);\n"
+    "      }\n"
+)
+_JS_FILE_BRANCH = (
+    "      else if (tag === \"input\" && el.type === \"file\") {\n"
+    "        if (el.files && el.files.length > 0) {\n"
+    "          try {\n"
+    "            const fileContent = await readFileAsText(el.files[0]);\n"
+    "            promptItems.push(fileContent);\n"
+    "          } catch (err) {\n"
+    "            console.error(\"Error reading file:\", err);\n"
+    "          }\n"
+    "        }\n"
+    "      }\n"
+)
+_JS_CLICK_END = (
+    "    }\n"
+    "    const prompt = promptItems.join(\"\\n\");\n"
+    "    navigator.clipboard.writeText(prompt)\n"
+    "      .then(() => { alert(\"Copied to clipboard!\"); })\n"
+    "      .catch((err) => { alert(\"Failed to copy: \" + err); });\n"
+    "    const resultPromptDiv = document.getElementById(\"resultPrompt\");\n"
+    "    resultPromptDiv.hidden = false;\n"
+    "    resultPromptDiv.textContent = prompt;\n"
+    "  });\n"
+)
+_JS_READ_FILE = (
+    "\n  function readFileAsText(file) {\n"
+    "    return new Promise((resolve, reject) => {\n"
+    "      const reader = new FileReader();\n"
+    "      reader.onload = () => resolve(reader.result);\n"
+    "      reader.onerror = reject;\n"
+    "      reader.readAsText(file);\n"
+    "    });\n"
+    "  }\n"
+)
+_JS_GET_TEXT = (
+    "\n  function getElementText(el) {\n"
+    "    let text = \"\";\n"
+    "    el.childNodes.forEach(node => {\n"
+    "      if (node.nodeType === Node.ELEMENT_NODE && node.tagName.toLowerCase() === \"input\") {\n"
+    "        if (node.type === \"text\" || node.type === \"number\") {\n"
+    "          text += node.value;\n"
+    "        }\n"
+    "      } else {\n"
+    "        text += node.textContent;\n"
+    "      }\n"
+    "    });\n"
+    "    return text.replace(/\\s+/g, \" \").trim();\n"
+    "  }\n"
+    "})();\n</script>"
+)
+
+# Button labels per language (HTML-escaped where necessary)
+_BUTTON_LABELS = {
+    'en': "Generate Prompt &amp; Copy to Clipboard",
+    'ja': "プロンプトを生成してクリップボードにコピー",
+    'fr': "Générer le prompt et copier dans le presse-papiers",
+    'it': "Genera prompt e copia negli appunti",
+    'es': "Generar prompt y copiar al portapapeles",
+}
+# Alternative language codes accepted in #lang:xx#
+_LANG_ALIASES = {'jp': 'ja'}
+
+_DEFAULT_TITLE = "Document"
+
+# Fixed parts of the HTML document, written around the body and the script.
+_DOC_HEAD = '''<!DOCTYPE html>
 <html lang="{lang}">
 <head>
   <meta charset="UTF-8" />
@@ -342,23 +290,248 @@ def parse_custom_markdown(md: str) -> Tuple[str, str]:
   {style_block}
 </head>
 <body>
-{html_body}
+'''
+_DOC_BUTTON = '''
 
 <button id="generateButton">{button_label}</button>
 
 <div class="result-box" id="resultPrompt" hidden></div>
 
-{script_block}
+'''
+_DOC_END = '''
 
 </body>
 </html>
 '''
-    return html_output, lang
+
+def write_html(md: str, out: IO[str]) -> str:
+    """
+    Parse extended Markdown text, write the full HTML document to a text stream,
+    and return the language code.
+
+    The parser:
+      - Extracts a language code if specified via #lang:xx# (default: en)
+      - Converts custom textarea elements, file load elements, checkboxes,
+        inline comments, inline integer inputs, inline text inputs, and verbatim blocks.
+      - Wraps the generated body in an HTML document with inline CSS and JS.
+
+    Args:
+        md (str): The input extended Markdown content.
+        out (IO[str]): Writable text stream (e.g. an open file) that receives the HTML.
+
+    Returns:
+        str: The language code.
+    """
+    # NUL is not allowed in HTML; dropping it also reserves NUL for the
+    # verbatim block placeholders below.
+    if "\x00" in md:
+        md = md.replace("\x00", "")
+    # Lines are split on "\n" only, so normalize \r\n and \r line endings.
+    if "\r" in md:
+        md = md.replace("\r\n", "\n").replace("\r", "\n")
+
+    # Detect language (default "en"). Most templates have no #lang:xx# marker,
+    # so a plain substring test avoids running the regex over them.
+    lang = 'en'
+    if "#lang:" in md:
+        lang_match = _LANG_RE.search(md)
+        if lang_match:
+            lang = lang_match.group(1)
+            md = _LANG_RE.sub('', md)
+
+    # Normalize language key for lookup (treat 'jp' and 'ja' the same)
+    lang_key = lang.lower()
+    lang_key = _LANG_ALIASES.get(lang_key, lang_key)
+    button_label = _BUTTON_LABELS.get(lang_key, _BUTTON_LABELS['en'])
+
+    title: str = _DEFAULT_TITLE
+    # The body is written straight into a buffer, one newline-terminated
+    # element at a time, instead of collecting a list and joining it.
+    body = io.StringIO()
+    emit = body.write
+    emit('<div id="promptContent">\n')
+
+    # Element kinds emitted so far (the _INLINE_PASSES kinds plus "h1" and
+    # "checkbox"); decides which CSS rules and JavaScript are needed.
+    features: set[str] = set()
+
+    # Convert the inline elements (<<n>>, [[[...]]], [[...]], (()), (* *)) with
+    # one pass per element, in _INLINE_PASSES order.
+    def convert_inline(text: str) -> str:
+        for kind, marker, pattern, handler in _INLINE_PASSES:
+            if marker in text:
+                text, count = pattern.subn(handler, text)
+                if count:
+                    features.add(kind)
+        return text
+
+    # Verbatim blocks {{{ ... }}} take precedence over everything else: they are
+    # located with str.find (linear, no backtracking even when a {{{ is never
+    # closed) and only the text between them goes through convert_inline().
+    # Single-line content becomes inline <code>. Multi-line content becomes a
+    # <pre><code> block that is kept aside in verbatim_blocks and replaced by a
+    # "\x00<index>\x00" placeholder line, so the line loop emits it untouched.
+    segments: list[str] = []
+    verbatim_blocks: list[str] = []
+    pos = 0
+    while True:
+        start = md.find("{{{", pos)
+        if start < 0:
+            break
+        end = md.find("}}}", start + 3)
+        if end < 0:
+            break
+        segments.append(convert_inline(md[pos:start]))
+        content = md[start + 3:end]
+        if "\n" in content:
+            segments.append(f"\n\x00{len(verbatim_blocks)}\x00\n")
+            verbatim_blocks.append(f'<pre><code>{content}</code></pre>')
+        else:
+            segments.append(f'<code>{content}</code>')
+        pos = end + 3
+    segments.append(convert_inline(md[pos:]))
+    md = "".join(segments)
+
+    # Walk the text (which now may include inserted HTML) line by line without
+    # materializing a list of lines. Each line is stripped once; its first
+    # character decides which (if any) of the more expensive checks below are
+    # worth running.
+    lines = _iter_stripped_lines(md)
+    line = next(lines, None)
+    while line is not None:
+        first = line[:1]
+
+        # Block-level verbatim placeholder: emit the stored <pre><code> block.
+        if first == '\x00':
+            emit(verbatim_blocks[int(line[1:-1])])
+            emit('\n')
+        # Process header lines (e.g. "# Header")
+        elif first == '#':
+            header_level = 1
+            while header_level < 6 and header_level < len(line) and line[header_level] == '#':
+                header_level += 1
+            header_text = line[header_level:].strip()
+            # A line of only "#"s keeps its last "#" as the text ("##" is an
+            # h1 reading "#"); a lone "#" is dropped.
+            if not header_text and header_level > 1:
+                header_level -= 1
+                header_text = '#'
+            if header_text:
+                if title == _DEFAULT_TITLE:
+                    title = header_text
+                if header_level == 1:
+                    features.add('h1')
+                emit(f'<h{header_level}>{header_text}</h{header_level}>\n')
+        # Process checkbox lines that start with "[ ]" or "[x]"
+        elif first == '[' and _is_checkbox(line):
+            checkbox_block: list[str] = []
+            while line is not None and _is_checkbox(line):
+                label_text = line[3:].strip()
+                # Lines with a box but no label are skipped.
+                if label_text:
+                    # The id keeps only word characters (letters, digits, "_") of the label.
+                    checkbox_id = label_text.translate(_WORD_CHARS)
+                    checked_attr = ' checked' if line[1] != ' ' else ''
+                    checkbox_block.append(
+                        f'<label class="prompt-item"><input type="checkbox" id="{checkbox_id}"{checked_attr} /> {label_text}</label>'
+                    )
+                line = next(lines, None)
+            if checkbox_block:
+                features.add('checkbox')
+                emit('<div class="checkbox-container">\n')
+                for cb_html in checkbox_block:
+                    emit(cb_html)
+                    emit('\n')
+                emit('</div>\n')
+            continue
+        # For textarea elements inserted by our custom syntax, add the "prompt-item" class.
+        elif first == '<' and line.startswith("<textarea"):
+            if 'class="' in line:
+                line = _CLASS_ATTR_RE.sub(r'class="\1 prompt-item"', line)
+            else:
+                line = line.replace("<textarea", '<textarea class="prompt-item"', 1)
+            emit(line)
+            emit('\n')
+        # For any non-empty line, wrap it in a paragraph tag.
+        elif line:
+            emit(f'<p class="prompt-item">{line}</p>\n')
+        line = next(lines, None)
+
+    emit("</div>")
+    html_body = body.getvalue()
+
+    # Build a dynamic <style> block including only the rules for elements that were emitted.
+    style_block = "<style>\n" + "\n".join(
+        css for feature, css in _CSS_SPEC if feature is None or feature in features
+    ) + "\n</style>"
+
+    # Only output the file-reading JavaScript when a file input is present.
+    if 'file' in features:
+        script_block = "".join((
+            _JS_HEAD, _JS_SELECTOR_WITH_FILE, _JS_LOOP, _JS_FILE_BRANCH,
+            _JS_CLICK_END, _JS_READ_FILE, _JS_GET_TEXT,
+        ))
+    else:
+        script_block = "".join((_JS_HEAD, _JS_SELECTOR, _JS_LOOP, _JS_CLICK_END, _JS_GET_TEXT))
+
+    # Write the document in order to the output stream.
+    write = out.write
+    write(_DOC_HEAD.format(lang=lang, title=title, style_block=style_block))
+    write(html_body)
+    write(_DOC_BUTTON.format(button_label=button_label))
+    write(script_block)
+    write(_DOC_END)
+    return lang
+
+def parse_custom_markdown(md: str) -> Tuple[str, str]:
+    """
+    Parse extended Markdown text and return the full HTML output and language code.
+
+    See write_html() for the supported syntax.
+
+    Args:
+        md (str): The input extended Markdown content.
+
+    Returns:
+        Tuple[str, str]: A tuple where the first element is the complete HTML output
+                         and the second is the language code.
+    """
+    out = io.StringIO()
+    lang = write_html(md, out)
+    return out.getvalue(), lang
+
+def _convert_file(input_file: str, output_file: str) -> str:
+    """
+    Convert one extended Markdown file to an HTML file.
+
+    Runs in a worker process when several files are converted, so errors are
+    returned as the message to print rather than printed here.
+
+    Args:
+        input_file (str): Path of the Markdown file to read.
+        output_file (str): Path of the HTML file to write.
+
+    Returns:
+        str: A status or error message for the user.
+    """
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+    except Exception as e:
+        return f"Error reading '{input_file}': {e}"
+
+    # Write the HTML straight to the output file rather than building it in memory first.
+    try:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            write_html(md_content, f)
+    except Exception as e:
+        return f"Error writing to '{output_file}': {e}"
+    return f"Generated HTML file: {output_file}"
 
 def main() -> None:
     """
-    Main function: parses command-line arguments, reads input Markdown files,
-    converts them to HTML, and writes the output files (after confirming overwrites).
+    Main function: parses command-line arguments, confirms overwrites, and converts
+    the input Markdown files to HTML (in parallel worker processes for several files).
     """
     parser = argparse.ArgumentParser(
         description="Extended Markdown Parser: Convert extended Markdown to HTML."
@@ -374,38 +547,47 @@ def main() -> None:
     )
     args = parser.parse_args()
 
+    # Resolve output names and ask about overwrites up front, in this process,
+    # so the workers never touch stdin. Keyed by the resolved output path, so
+    # different spellings of one file (a.html, ./a.html) are the same job: if
+    # several inputs map to the same output, only the last confirmed one is
+    # converted. Values keep the paths as the user wrote them, for messages.
+    jobs: Dict[str, Tuple[str, str]] = {}
     for input_file in args.input_files:
         if not os.path.isfile(input_file):
             print(f"Error: File '{input_file}' not found.")
             continue
 
-        try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-        except Exception as e:
-            print(f"Error reading '{input_file}': {e}")
-            continue
-
-        html_output, _ = parse_custom_markdown(md_content)
-
         if args.output:
             output_file = args.output
         else:
             base, _ = os.path.splitext(input_file)
             output_file = base + ".html"
 
-        if os.path.exists(output_file):
+        output_key = os.path.normcase(os.path.realpath(output_file))
+        if output_key in jobs or os.path.exists(output_file):
             overwrite = input(f"File '{output_file}' already exists. Overwrite? (y/n): ").strip().lower()
             if overwrite not in ('y', 'yes'):
                 print(f"Skipping file '{output_file}'.")
                 continue
-
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(html_output)
-            print(f"Generated HTML file: {output_file}")
-        except Exception as e:
-            print(f"Error writing to '{output_file}': {e}")
+            jobs.pop(output_key, None)
+
+        jobs[output_key] = (input_file, output_file)
+
+    # Cap the pool at the number of jobs: with the fork start method the
+    # executor starts all of its workers up front. With a single worker the
+    # pool would only add start-up cost, so convert in this process instead.
+    workers = min(len(jobs), os.cpu_count() or 1)
+    if workers > 1:
+        # Imported here: loading the process pool machinery costs more than
+        # converting a typical file, and single-file runs never need it.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            messages = list(executor.map(_convert_file, *zip(*jobs.values())))
+    else:
+        messages = [_convert_file(input_file, output_file) for input_file, output_file in jobs.values()]
+    for message in messages:
+        print(message)
 
 if __name__ == "__main__":
     main()
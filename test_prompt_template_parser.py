@@ -1,24 +1,182 @@
 #!/usr/bin/env pytest
+import concurrent.futures
+import importlib.util
+import io
+import os
 import re
+import sys
+from html.parser import HTMLParser
 import pytest
-from prompt_template_parser import parse_custom_markdown
-from bs4 import BeautifulSoup
+import prompt_template_parser
+from prompt_template_parser import parse_custom_markdown, write_html
 
-def test_default_language():
-    md = "This is a simple test."
-    html, lang = parse_custom_markdown(md)
-    # Default language should be "en"
-    assert lang == "en"
-    # The HTML should reflect the language in the <html> tag.
-    assert '<html lang="en">' in html
+class _TextboxScanner(HTMLParser):
+    """Streams through the HTML once and records the attributes and text of
+    <textarea id="textbox">; nothing else is kept, so no DOM is built."""
+
+    def __init__(self):
+        super().__init__()
+        self.attrs = None
+        self.text = None
+        self._inside = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'textarea' and self.attrs is None:
+            attrs = dict(attrs)
+            if attrs.get('id') == 'textbox':
+                self.attrs = attrs
+                self.text = ''
+                self._inside = True
+
+    def handle_endtag(self, tag):
+        if tag == 'textarea':
+            self._inside = False
+
+    def handle_data(self, data):
+        if self._inside:
+            self.text += data
+
+def _scan_textbox(html):
+    scanner = _TextboxScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner
+
+# The checked box may be written as a bare "checked" or as checked="checked".
+_CHECKED_RE = re.compile(r'<input type="checkbox" id="Option2" checked(?:="checked")?\s*/?>')
+
+# Markdown fragments for each element. The element tests check them inside
+# MD_COMBINED, which is parsed once by the `combined` fixture.
+MD_HEADING = "# My Document\nThis is a paragraph."
+MD_TEXTAREA = '[[[Input text:something]]]'
+MD_INLINE_TEXT = '[[Input text:something]]'
+MD_INTEGER = "Value: << 42 >>"
+MD_FILE = "Load file: (())"
+MD_COMMENT = "Comment here: (* This is a comment *)"
+MD_CHECKBOXES = "[ ] Option 1\n[x] Option 2"
+MD_VERBATIM_INLINE = "Inline code: {{{print('hello')}}}"
+MD_VERBATIM_BLOCK = "Block verbatim:\n{{{\nprint('hello')\nprint('world')\n}}}"
+MD_COMBINED = "\n".join((
+    MD_HEADING,
+    MD_TEXTAREA,
+    MD_INLINE_TEXT,
+    MD_INTEGER,
+    MD_FILE,
+    MD_COMMENT,
+    MD_CHECKBOXES,
+    MD_VERBATIM_INLINE,
+    MD_VERBATIM_BLOCK,
+))
+
+# Expected markup for the fragments above.
+_EXP_HEADING = '<h1>My Document</h1>'
+# Non-header non-empty lines should be wrapped in a paragraph tag.
+_EXP_PARAGRAPH = '<p class="prompt-item">This is a paragraph.</p>'
+_EXP_TEXTAREA = '<textarea class="prompt-item" id="textbox" placeholder="Input text">something</textarea>'
+_EXP_INLINE_TEXT = '<input type="text" class="inline-text" placeholder="Input text" value="something" />'
+_EXP_INT = '<input type="number" class="inline-input" value="42" min="1" />'
+_EXP_FILE = '<input type="file" id="fileLoad" class="prompt-item" />'
+_EXP_COMMENT = '<span class="comment" data-no-clipboard="true">This is a comment</span>'
+_EXP_CHECKBOX_CONTAINER = '<div class="checkbox-container">'
+# The checkbox IDs are derived from the label text (whitespace and non-word characters removed).
+_EXP_CHECKBOX_UNCHECKED = '<label class="prompt-item"><input type="checkbox" id="Option1" /> Option 1</label>'
+_EXP_VERBATIM_INLINE = "<code>print('hello')</code>"
+# Block verbatim should be wrapped in <pre><code> ... </code></pre>
+_EXP_VERBATIM_BLOCK = "<pre><code>\nprint('hello')\nprint('world')\n</code></pre>"
+
+# Button labels per language.
+_LABEL_EN = "Generate Prompt &amp; Copy to Clipboard"
+_LABEL_JA = "プロンプトを生成してクリップボードにコピー"
+_LABEL_FR = "Générer le prompt et copier dans le presse-papiers"
+_LABEL_IT = "Genera prompt e copia negli appunti"
+_LABEL_ES = "Generar prompt y copiar al portapapeles"
+
+# Expected markup for each fragment, in MD_COMBINED order.
+COMBINED_ELEMENTS = [
+    pytest.param(_EXP_HEADING, id="heading"),
+    pytest.param(_EXP_PARAGRAPH, id="paragraph"),
+    pytest.param(_EXP_TEXTAREA, id="textarea"),
+    pytest.param(_EXP_INLINE_TEXT, id="inline-text"),
+    pytest.param(_EXP_INT, id="inline-integer"),
+    pytest.param(_EXP_FILE, id="file-load"),
+    pytest.param(_EXP_COMMENT, id="inline-comment"),
+    pytest.param(_EXP_CHECKBOX_CONTAINER, id="checkbox-container"),
+    pytest.param(_EXP_VERBATIM_INLINE, id="verbatim-inline"),
+    pytest.param(_EXP_VERBATIM_BLOCK, id="verbatim-block"),
+]
+
+@pytest.fixture(scope="module")
+def combined():
+    """MD_COMBINED converted once and shared by the element tests: (html, lang, textbox scanner)."""
+    html, lang = parse_custom_markdown(MD_COMBINED)
+    return html, lang, _scan_textbox(html)
 
-def test_language_specified():
-    md = "#lang:jp#\nSome content here."
+@pytest.mark.parametrize("expected", COMBINED_ELEMENTS)
+def test_combined_contains(combined, expected):
+    html, _, _ = combined
+    assert expected in html
+
+# (markdown, expected HTML substring) pairs that need their own input.
+SUBSTRING_CASES = [
+    # Custom syntax inside a verbatim block must not be converted.
+    pytest.param("Code: {{{x = [[a:b]] << 3 >> (())}}}", '<code>x = [[a:b]] << 3 >> (())</code>', id="verbatim-not-converted"),
+    # A stray [[ earlier in the document must not swallow a later [[[...]]].
+    pytest.param("# Notes\nSee [[wiki page]] for details.\n\n[[[Describe the task:Write a summary]]]\n",
+                 '<textarea class="prompt-item" id="textbox" placeholder="Describe the task">Write a summary</textarea>',
+                 id="textarea-after-stray-brackets"),
+    # A literal </code></pre> inside a block does not end the block early.
+    pytest.param("{{{\na </code></pre>\nb\n}}}\nafter",
+                 '<pre><code>\na </code></pre>\nb\n</code></pre>\n<p class="prompt-item">after</p>',
+                 id="verbatim-block-containing-end-tag"),
+    # NUL characters are dropped, so input cannot fake a verbatim placeholder line.
+    pytest.param("a\x00b {{{x\x00y}}}\n\x000\x00",
+                 '<p class="prompt-item">ab <code>xy</code></p>\n<p class="prompt-item">0</p>',
+                 id="nul-stripped"),
+    # \r\n and \r line endings split lines like \n.
+    pytest.param("x\r\n# T\r\n[x] a b\r\n",
+                 '<p class="prompt-item">x</p>\n<h1>T</h1>\n<div class="checkbox-container">\n'
+                 '<label class="prompt-item"><input type="checkbox" id="ab" checked /> a b</label>',
+                 id="crlf-line-endings"),
+    pytest.param("x\r# T\r[ ] a\r",
+                 '<p class="prompt-item">x</p>\n<h1>T</h1>\n<div class="checkbox-container">\n'
+                 '<label class="prompt-item"><input type="checkbox" id="a" /> a</label>',
+                 id="cr-line-endings"),
+    # Other Unicode line boundaries (U+2028, form feed, NEL) stay inside the line.
+    pytest.param("a\u2028b\x0cc\x85d\n# T",
+                 '<p class="prompt-item">a\u2028b\x0cc\x85d</p>\n<h1>T</h1>',
+                 id="unicode-line-separators-not-split"),
+]
+
+@pytest.mark.parametrize("md, expected", SUBSTRING_CASES)
+def test_html_contains(md, expected):
+    html, _ = parse_custom_markdown(md)
+    assert expected in html
+
+# Header lines: up to six leading "#"s give the level, the rest is the text.
+HEADER_CASES = [
+    pytest.param("#abc", '<h1>abc</h1>\n', id="no-space"),
+    # A seventh "#" is part of the text of an h6.
+    pytest.param("####### x", '<h6># x</h6>\n', id="more-than-six"),
+    # A line of only "#"s keeps its last "#" as the text.
+    pytest.param("##", '<h1>#</h1>\n', id="only-hashes"),
+    # A lone "#" has no text and is dropped.
+    pytest.param("#", '', id="lone-hash"),
+]
+
+@pytest.mark.parametrize("md, expected", HEADER_CASES)
+def test_header_lines(md, expected):
+    html, _ = parse_custom_markdown(md)
+    assert f'<div id="promptContent">\n{expected}</div>' in html
+
+@pytest.mark.parametrize("md, expected_lang", [
+    pytest.param("This is a simple test.", "en", id="default-language"),
+    pytest.param("#lang:jp#\nSome content here.", "jp", id="language-specified"),
+])
+def test_language_code(md, expected_lang):
     html, lang = parse_custom_markdown(md)
-    # Extracted language should be "jp"
-    assert lang == "jp"
-    # The <html> tag should have lang="jp" and the language marker should be removed.
-    assert '<html lang="jp">' in html
+    # The language is returned and set on <html>, and the marker is removed from the output.
+    assert lang == expected_lang
+    assert f'<html lang="{expected_lang}">' in html
     assert "#lang:" not in html
 
 def test_language_button_labels():
@@ -26,169 +184,157 @@ def test_language_button_labels():
     # Test English (default)
     md_en = "Test content"
     html_en, _ = parse_custom_markdown(md_en)
-    assert "Generate Prompt &amp; Copy to Clipboard" in html_en
+    assert _LABEL_EN in html_en
     
     # Test Japanese
     md_ja = "#lang:ja#\nTest content"
     html_ja, _ = parse_custom_markdown(md_ja)
-    assert "プロンプトを生成してクリップボードにコピー" in html_ja
+    assert _LABEL_JA in html_ja
     
     # Test Japanese with 'jp' code (should normalize to 'ja')
     md_jp = "#lang:jp#\nTest content"
     html_jp, _ = parse_custom_markdown(md_jp)
-    assert "プロンプトを生成してクリップボードにコピー" in html_jp
+    assert _LABEL_JA in html_jp
     
     # Test French
     md_fr = "#lang:fr#\nTest content"
     html_fr, _ = parse_custom_markdown(md_fr)
-    assert "Générer le prompt et copier dans le presse-papiers" in html_fr
+    assert _LABEL_FR in html_fr
     
     # Test Italian
     md_it = "#lang:it#\nTest content"
     html_it, _ = parse_custom_markdown(md_it)
-    assert "Genera prompt e copia negli appunti" in html_it
+    assert _LABEL_IT in html_it
     
     # Test Spanish
     md_es = "#lang:es#\nTest content"
     html_es, _ = parse_custom_markdown(md_es)
-    assert "Generar prompt y copiar al portapapeles" in html_es
+    assert _LABEL_ES in html_es
     
     # Test unsupported language (should fall back to English)
     md_unsupported = "#lang:de#\nTest content"
     html_unsupported, _ = parse_custom_markdown(md_unsupported)
-    assert "Generate Prompt &amp; Copy to Clipboard" in html_unsupported
+    assert _LABEL_EN in html_unsupported
 
-def test_inline_integer():
-    md = "Value: << 42 >>"
-    html, _ = parse_custom_markdown(md)
-    expected = '<input type="number" class="inline-input" value="42" min="1" />'
-    assert expected in html
+def test_write_html_matches_parse():
+    md = "#lang:fr#\n# Title\nLoad file: (())"
+    out = io.StringIO()
+    lang = write_html(md, out)
+    assert lang == "fr"
+    assert out.getvalue() == parse_custom_markdown(md)[0]
 
-def test_textbox_and_inline_textbox():
+def test_textbox_and_inline_textbox(combined):
+    html, _, textbox = combined
     # Test the textarea element (triple-bracket syntax)
-    md_textarea = '[[[Input text:something]]]'
-    html_textarea, _ = parse_custom_markdown(md_textarea)
-    soup = BeautifulSoup(html_textarea, 'html.parser')
-    textarea = soup.find('textarea', id='textbox')
-    assert textarea is not None, "Textarea with id 'textbox' not found"
-    assert textarea.get('placeholder') == "Input text"
-    assert "prompt-item" in textarea.get('class', [])
-    assert textarea.text.strip() == "something"
+    attrs = textbox.attrs
+    assert attrs is not None, "Textarea with id 'textbox' not found"
+    assert attrs.get('placeholder') == "Input text"
+    assert "prompt-item" in set(attrs.get('class', '').split())
+    assert textbox.text.strip() == "something"
 
     # Test the inline text input (double-bracket syntax)
-    md_inline = '[[Input text:something]]'
-    html_inline, _ = parse_custom_markdown(md_inline)
-    soup_inline = BeautifulSoup(html_inline, 'html.parser')
-    input_text = soup_inline.find('input', {'type': 'text'})
-    assert input_text is not None, "Inline text input not found"
-    assert input_text.get('placeholder') == "Input text"
-    assert input_text.get('value') == "something"
-
-def test_file_load_element():
-    md = "Load file: (())"
-    html, _ = parse_custom_markdown(md)
-    expected = '<input type="file" id="fileLoad" class="prompt-item" />'
-    assert expected in html
+    assert _EXP_INLINE_TEXT in html
 
-def test_inline_comment():
-    md = "Comment here: (* This is a comment *)"
-    html, _ = parse_custom_markdown(md)
-    expected = '<span class="comment" data-no-clipboard="true">This is a comment</span>'
-    assert expected in html
+def test_checkbox_elements(combined):
+    html, _, _ = combined
+    # The checkboxes should be wrapped in a container.
+    assert _EXP_CHECKBOX_CONTAINER in html
+    assert _EXP_CHECKBOX_UNCHECKED in html
+    assert _CHECKED_RE.search(html)
 
-def test_verbatim_inline():
-    md = "Inline code: {{{print('hello')}}}"
-    html, _ = parse_custom_markdown(md)
-    expected = '<code>print(\'hello\')</code>'
-    assert expected in html
+def test_combined_elements(combined):
+    html, lang, _ = combined
+    assert lang == "en"
+    # Every element is emitted, in the same order as its fragment in MD_COMBINED.
+    positions = [html.find(param.values[0]) for param in COMBINED_ELEMENTS]
+    assert -1 not in positions
+    assert positions == sorted(positions)
 
-def test_verbatim_block():
-    md = "Block verbatim:\n{{{\nprint('hello')\nprint('world')\n}}}"
-    html, _ = parse_custom_markdown(md)
-    # Block verbatim should be wrapped in <pre><code> ... </code></pre>
-    assert '<pre><code>' in html
-    assert '</code></pre>' in html
+class _SerialExecutor:
+    """Stands in for ProcessPoolExecutor: runs jobs in-process and records max_workers."""
+    instances = []
 
-def test_checkbox_elements():
-    md = "[ ] Option 1\n[x] Option 2"
-    html, _ = parse_custom_markdown(md)
-    # The checkboxes should be wrapped in a container.
-    assert '<div class="checkbox-container">' in html
-    # The checkbox IDs are derived from the label text (whitespace and non-word characters removed).
-    expected_unchecked = '<label class="prompt-item"><input type="checkbox" id="Option1" /> Option 1</label>'
-    expected_checked = '<label class="prompt-item"><input type="checkbox" id="Option2" checked'
-    assert expected_unchecked in html
-    assert expected_checked in html
-
-def test_heading_and_paragraph():
-    md = "# My Document\nThis is a paragraph."
-    html, _ = parse_custom_markdown(md)
-    # Check that the header is processed correctly.
-    assert '<h1>My Document</h1>' in html
-    # Non-header non-empty lines should be wrapped in a paragraph tag.
-    assert '<p class="prompt-item">This is a paragraph.</p>' in html
-
-def test_combined_elements():
-    md = (
-        "# Title\n"
-        "Introduction text.\n"
-        "[[[Input text:something]]]\n"
-        "[[Input text:something]]\n"
-        "Number: << 100 >>\n"
-        "File: (())\n"
-        "(* A comment *)\n"
-        "[ ] Checkbox Option\n"
-        "Inline verbatim: {{{inline code}}}\n"
-        "Block verbatim:\n{{{\nBlock\nContent\n}}}"
-    )
-    html, lang = parse_custom_markdown(md)
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # Check heading
-    h1 = soup.find('h1')
-    assert h1 is not None and h1.text.strip() == "Title"
-    
-    # Check paragraph wrapping for the introduction
-    intro_paragraph = soup.find('p', class_='prompt-item')
-    assert intro_paragraph is not None
-    assert "Introduction text." in intro_paragraph.text
-
-    # Check textarea element
-    textarea = soup.find('textarea', id='textbox')
-    assert textarea is not None, "Textarea with id 'textbox' not found"
-    assert textarea.get('placeholder') == "Input text"
-    assert "prompt-item" in textarea.get('class', [])
-    assert textarea.text.strip() == "something"
-
-    # Check inline text input
-    inline_input = soup.find('input', {'type': 'text'})
-    assert inline_input is not None, "Inline text input not found"
-    assert inline_input.get('placeholder') == "Input text"
-    assert inline_input.get('value') == "something"
-
-    # Check inline integer input
-    inline_integer = soup.find('input', {'type': 'number'})
-    assert inline_integer is not None, "Inline integer input not found"
-    assert inline_integer.get('value') == "100"
-
-    # Check file load element
-    file_input = soup.find('input', {'type': 'file'})
-    assert file_input is not None, "File input not found"
-
-    # Check inline comment
-    comment_span = soup.find('span', class_='comment')
-    assert comment_span is not None, "Comment span not found"
-    assert comment_span.text.strip() == "A comment"
-
-    # Check checkbox element
-    checkbox_label = soup.find('label', class_='prompt-item')
-    assert checkbox_label is not None, "Checkbox label not found"
-
-    # Check inline verbatim element
-    inline_verbatim = soup.find('code')
-    assert inline_verbatim is not None, "Inline verbatim code element not found"
-    assert inline_verbatim.text.strip() == "inline code"
-
-    # Check block verbatim element exists
-    pre_code = soup.find('pre')
-    assert pre_code is not None, "Block verbatim (pre element) not found"
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        _SerialExecutor.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+@pytest.fixture
+def run_main(monkeypatch, tmp_path):
+    """Run main() in tmp_path with the given arguments and answers to the overwrite prompt.
+    Returns the list of prompts shown; the executors created are in _SerialExecutor.instances."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", _SerialExecutor)
+    _SerialExecutor.instances = []
+
+    def run(args, answers=()):
+        prompts = []
+        replies = iter(answers)
+
+        def fake_input(prompt):
+            prompts.append(prompt)
+            return next(replies)
+
+        monkeypatch.setattr("builtins.input", fake_input)
+        monkeypatch.setattr(sys, "argv", ["prompt_template_parser.py", *args])
+        prompt_template_parser.main()
+        return prompts
+    return run
+
+def test_main_single_file_is_converted_serially(run_main, tmp_path):
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    assert run_main(["a.md"]) == []
+    assert "<h1>A</h1>" in (tmp_path / "a.html").read_text(encoding="utf-8")
+    assert _SerialExecutor.instances == []
+
+@pytest.mark.parametrize("cpus, expected_workers", [
+    (4, [2]),  # the pool is no larger than the number of files
+    (1, []),   # one CPU: no pool, the files are converted in this process
+])
+def test_main_several_files_pool_size(run_main, tmp_path, monkeypatch, cpus, expected_workers):
+    monkeypatch.setattr(os, "cpu_count", lambda: cpus)
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    (tmp_path / "b.md").write_text("# B", encoding="utf-8")
+    assert run_main(["a.md", "b.md"]) == []
+    assert "<h1>A</h1>" in (tmp_path / "a.html").read_text(encoding="utf-8")
+    assert "<h1>B</h1>" in (tmp_path / "b.html").read_text(encoding="utf-8")
+    assert [e.max_workers for e in _SerialExecutor.instances] == expected_workers
+
+@pytest.mark.parametrize("answer, expected", [
+    ("y", "<h1>B</h1>"),  # the last confirmed input wins
+    ("n", "<h1>A</h1>"),
+])
+def test_main_duplicate_output_asks_before_overwriting(run_main, tmp_path, answer, expected):
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    (tmp_path / "b.md").write_text("# B", encoding="utf-8")
+    prompts = run_main(["a.md", "b.md", "-o", "out.html"], [answer])
+    assert prompts == ["File 'out.html' already exists. Overwrite? (y/n): "]
+    assert expected in (tmp_path / "out.html").read_text(encoding="utf-8")
+    # Only one job remains, so no pool is started.
+    assert _SerialExecutor.instances == []
+
+def test_main_same_output_spelled_differently_asks_once(run_main, tmp_path):
+    (tmp_path / "a.md").write_text("# A", encoding="utf-8")
+    (tmp_path / "a.txt").write_text("# B", encoding="utf-8")
+    # a.html and ./a.html are the same file.
+    prompts = run_main(["a.md", "./a.txt"], ["y"])
+    assert prompts == ["File './a.html' already exists. Overwrite? (y/n): "]
+    assert "<h1>B</h1>" in (tmp_path / "a.html").read_text(encoding="utf-8")
+    assert _SerialExecutor.instances == []
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(importlib.util.find_spec("pytest_benchmark") is None,
+                    reason="pytest-benchmark is not installed")
+def test_parse_perf(request, benchmark):
+    # pytest-benchmark times every benchmark by default; only do so on request.
+    if not (request.config.getoption("benchmark_enable") or request.config.getoption("benchmark_only")):
+        pytest.skip("run with --benchmark-enable or --benchmark-only")
+    benchmark(parse_custom_markdown, MD_COMBINED)